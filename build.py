@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+Rebuild the site data by running the build scripts in dependency order.
+
+Each stage declares its inputs and outputs. A stage is skipped when all of
+its outputs exist and are newer than its inputs, or when the inputs still
+match what they were the last time the stage ran (e.g. after a fresh
+checkout touched every mtime). Outputs that changed since the last run make
+a stage stale either way. Stages whose dependencies are satisfied run
+concurrently, and a per-stage timing summary is printed at the end.
+
+Usage (from the repo root):
+    python build.py                      # everything
+    python build.py panel suitability    # these stages + their dependencies
+    python build.py --force climate      # rerun climate even if up to date
+    python build.py --dry_run            # only report what would run
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+STAMP_DIR = ROOT / ".build" / "stamps"
+ASIDE_DIR = ROOT / ".build" / "previous"
+
+AVA_GEOJSON = "data/avas_wa.geojson"
+PRISM_CSV = "ava_prism_monthly_stats.csv"
+
+_print_lock = threading.Lock()
+
+
+@dataclass
+class Stage:
+    name: str
+    script: str
+    inputs: list[str]
+    outputs: list[str]
+    deps: list[str] = field(default_factory=list)
+    args: list[str] = field(default_factory=list)
+    env: dict[str, str] = field(default_factory=dict)
+    # env vars that must be set (non-empty) before the stage can run
+    requires_env: list[str] = field(default_factory=list)
+    # for scripts that resume from (and trust) their existing outputs: if any
+    # of these inputs changed since the last run, move the outputs aside so
+    # the script starts over. Other input changes let it resume.
+    fresh_when: list[str] = field(default_factory=list)
+
+
+def build_stages(prism_root: str | None) -> dict[str, Stage]:
+    """
+    Declare the pipeline. Paths are relative to the repo root unless absolute.
+    """
+    climate_inputs = [AVA_GEOJSON]
+    if prism_root:
+        climate_inputs += [
+            os.path.join(prism_root, "tmean", "*.zip"),
+            os.path.join(prism_root, "ppt", "*.zip"),
+        ]
+
+    stages = [
+        Stage(
+            name="merge",
+            script="merge_geojson.py",
+            # merge_geojson.py skips its own output when globbing data/*.geojson
+            inputs=["data/*.geojson"],
+            outputs=[AVA_GEOJSON],
+        ),
+        Stage(
+            name="vineyards",
+            script="scripts/vineyards/make_vineyards_by_ava.py",
+            inputs=["data/wsda/2024WSDACropDistribution.gdb", AVA_GEOJSON],
+            outputs=["assets/data/vineyards_by_ava"],
+            deps=["merge"],
+        ),
+        Stage(
+            name="climate",
+            script="scripts/climate/climate_loop.py",
+            inputs=climate_inputs,
+            outputs=[PRISM_CSV],
+            deps=["merge"],
+            env={
+                "PRISM_ROOT": prism_root or "",
+                "AVA_GEOJSON": str(ROOT / AVA_GEOJSON),
+            },
+            requires_env=["PRISM_ROOT"],
+            # climate_loop.py has RESUME on and skips (ava_id, ym) rows already
+            # in the CSV. That's what we want for new PRISM months, but AVA or
+            # script changes invalidate every row.
+            fresh_when=[AVA_GEOJSON, "scripts/climate/climate_loop.py"],
+        ),
+        Stage(
+            name="panel",
+            script="scripts/climate/make_panel_json.py",
+            inputs=[PRISM_CSV],
+            outputs=["assets/data/ava_panel_stats.json"],
+            deps=["climate"],
+        ),
+        Stage(
+            name="suitability",
+            script="scripts/climate/make_suitability_stats.py",
+            inputs=[PRISM_CSV],
+            outputs=["data/ava_climate_suitability.json"],
+            deps=["climate"],
+            args=["--in_csv", PRISM_CSV, "--out_json", "data/ava_climate_suitability.json"],
+        ),
+    ]
+    return {s.name: s for s in stages}
+
+
+# -----------------------------
+# Up-to-date checks
+# -----------------------------
+def expand(patterns: list[str], exclude: set[Path] = frozenset()) -> list[Path]:
+    """
+    Resolve paths/globs to a sorted list of files. Directories expand to every
+    file beneath them. Anything that doesn't exist is simply dropped.
+    """
+    files = set()
+    for pat in patterns:
+        full = pat if os.path.isabs(pat) else str(ROOT / pat)
+        for hit in glob.glob(full):
+            p = Path(hit)
+            if p.is_dir():
+                files.update(q for q in p.rglob("*") if q.is_file())
+            elif p.is_file():
+                files.add(p)
+    return sorted(f.resolve() for f in files if f.resolve() not in exclude)
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fingerprint(path: Path, prev: dict | None = None) -> dict:
+    """
+    Size + mtime for every file, plus a sha256 for files inside the repo.
+    The hash is reused from `prev` when size and mtime haven't moved, so only
+    files that were actually touched get re-read. Files outside the repo (the
+    PRISM archive) are never hashed: a checkout can't touch their mtimes, and
+    hashing GBs of zips on every build would defeat the point.
+    """
+    st = path.stat()
+    fp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if prev and prev.get("size") == fp["size"] and prev.get("mtime_ns") == fp["mtime_ns"]:
+        if "sha256" in prev:
+            fp["sha256"] = prev["sha256"]
+    elif path.is_relative_to(ROOT):
+        fp["sha256"] = file_hash(path)
+    return fp
+
+
+def stamp_key(path: Path) -> str:
+    # repo-relative so moving or renaming the checkout doesn't invalidate stamps
+    return path.relative_to(ROOT).as_posix() if path.is_relative_to(ROOT) else str(path)
+
+
+def fingerprints(paths: list[Path], prev: dict | None = None) -> dict[str, dict]:
+    prev = prev or {}
+    return {stamp_key(p): fingerprint(p, prev.get(stamp_key(p))) for p in paths}
+
+
+def same_file(a: dict, b: dict) -> bool:
+    if "sha256" in a and "sha256" in b:
+        return a["sha256"] == b["sha256"]
+    return a["size"] == b["size"] and a["mtime_ns"] == b["mtime_ns"]
+
+
+def stage_inputs(stage: Stage) -> list[Path]:
+    # The script itself counts as an input so edits to it trigger a rebuild.
+    outputs = set(expand(stage.outputs))
+    return expand(stage.inputs + [stage.script], exclude=outputs)
+
+
+def stamp_path(stage: Stage) -> Path:
+    return STAMP_DIR / f"{stage.name}.json"
+
+
+def read_stamp(stage: Stage) -> dict | None:
+    try:
+        stamp = json.loads(stamp_path(stage).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(stamp, dict) or not {"inputs", "outputs"} <= set(stamp):
+        return None
+    return stamp
+
+
+def input_fingerprints(stage: Stage) -> dict[str, dict]:
+    stamp = read_stamp(stage) or {}
+    return fingerprints(stage_inputs(stage), stamp.get("inputs"))
+
+
+def write_stamp(stage: Stage, inputs: dict[str, dict], outputs: dict[str, dict]) -> None:
+    STAMP_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = {"inputs": inputs, "outputs": outputs}
+    stamp_path(stage).write_text(json.dumps(stamp, indent=2), encoding="utf-8")
+
+
+def is_up_to_date(stage: Stage, persist: bool = True) -> tuple[bool, str]:
+    """
+    Return (up_to_date, reason). With persist=False the stamp is left alone
+    even when refreshed mtimes could be recorded (used by --dry_run).
+    """
+    for pat in stage.outputs:
+        if not expand([pat]):
+            return False, f"missing output {pat}"
+
+    inputs = stage_inputs(stage)
+    outputs = expand(stage.outputs)
+    stamp = read_stamp(stage)
+
+    # inputs added/removed or outputs edited since the last build make the
+    # stage stale whatever the mtimes say
+    current_out = None
+    if stamp is not None:
+        if set(stamp["inputs"]) != {stamp_key(p) for p in inputs}:
+            return False, "input set changed"
+        recorded_out = stamp["outputs"]
+        if set(recorded_out) != {stamp_key(p) for p in outputs}:
+            return False, "output set changed"
+        current_out = fingerprints(outputs, recorded_out)
+        for key, fp in current_out.items():
+            if not same_file(fp, recorded_out[key]):
+                return False, f"output {Path(key).name} changed since last build"
+
+    oldest_out = min(p.stat().st_mtime for p in outputs)
+    newest_in = max((p.stat().st_mtime for p in inputs), default=0.0)
+    if newest_in <= oldest_out:
+        return True, "outputs newer than inputs"
+
+    # mtimes say stale; fall back to what the inputs looked like last run
+    if stamp is None:
+        return False, "inputs newer than outputs"
+
+    recorded = stamp["inputs"]
+    current = fingerprints(inputs, recorded)
+    for key, fp in current.items():
+        if not same_file(fp, recorded[key]):
+            return False, f"changed input {Path(key).name}"
+
+    # remember the new mtimes so the next build doesn't rehash these files
+    if persist:
+        write_stamp(stage, current, current_out)
+    return True, "input hashes unchanged"
+
+
+# -----------------------------
+# Running
+# -----------------------------
+def log(stage_name: str, msg: str) -> None:
+    with _print_lock:
+        print(f"[{stage_name}] {msg}", flush=True)
+
+
+def run_stage(stage: Stage) -> int:
+    """
+    Run the stage's script from the repo root, streaming its output with a
+    [stage] prefix so concurrent stages stay readable.
+    """
+    env = os.environ.copy()
+    env.update(stage.env)
+    env["PYTHONUNBUFFERED"] = "1"
+
+    cmd = [sys.executable, str(ROOT / stage.script), *stage.args]
+    proc = subprocess.Popen(
+        cmd,
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    for line in proc.stdout:
+        log(stage.name, line.rstrip("\n"))
+    return proc.wait()
+
+
+def remove(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def start_over_reason(stage: Stage, inputs: dict[str, dict]) -> str | None:
+    """
+    Return why the stage's existing outputs can't be resumed from, or None.
+    """
+    if not stage.fresh_when or not expand(stage.outputs):
+        return None
+    stamp = read_stamp(stage)
+    if stamp is None:
+        return "no record of what the existing outputs were built from"
+    for key in (stamp_key(p) for p in expand(stage.fresh_when)):
+        prev = stamp["inputs"].get(key)
+        if prev is None or key not in inputs or not same_file(inputs[key], prev):
+            return f"{Path(key).name} changed"
+    return None
+
+
+def move_aside(stage: Stage) -> None:
+    """
+    Move the stage's existing outputs under .build/previous/ so the script
+    starts from nothing.
+    """
+    for out in stage.outputs:
+        src = ROOT / out
+        if not src.exists():
+            continue
+        dst = ASIDE_DIR / stage.name / src.name
+        remove(dst)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(src, dst)
+
+
+def select(stages: dict[str, Stage], targets: list[str]) -> list[str]:
+    """
+    Return the requested stages plus everything they depend on.
+    """
+    wanted = set()
+    stack = list(targets or stages)
+    while stack:
+        name = stack.pop()
+        if name not in stages:
+            raise SystemExit(f"Unknown stage {name!r}. Choose from: {', '.join(stages)}")
+        if name not in wanted:
+            wanted.add(name)
+            stack.extend(stages[name].deps)
+    return [n for n in stages if n in wanted]  # keep declaration order
+
+
+def execute(stages: dict[str, Stage], order: list[str], forced: set[str], dry_run: bool, jobs: int) -> dict:
+    """
+    Walk the DAG, running each stage once its dependencies have finished.
+    Stages in `forced` run even if up to date. Returns {stage_name: (status, seconds)}.
+    """
+    results = {}
+    pending = list(order)
+    running = {}
+
+    def start(name: str):
+        stage = stages[name]
+        t0 = time.perf_counter()
+
+        # in a dry run nothing upstream actually changes, so anything
+        # downstream of a stage that would run is stale too
+        upstream = [d for d in stage.deps if results.get(d, ("",))[0] == "would run"]
+        if upstream:
+            log(name, f"stale: upstream {', '.join(upstream)} would run")
+        elif name not in forced:
+            ok, reason = is_up_to_date(stage, persist=not dry_run)
+            if ok:
+                log(name, f"up to date ({reason}), skipping")
+                return "skipped", time.perf_counter() - t0
+            log(name, f"stale: {reason}")
+
+        missing = [k for k in stage.requires_env if not stage.env.get(k)]
+        if missing:
+            log(name, f"❌ cannot run, missing {', '.join(missing)}")
+            return "failed", time.perf_counter() - t0
+
+        if dry_run:
+            log(name, "would run")
+            return "would run", time.perf_counter() - t0
+
+        # hash what the stage is about to read, not what's there once it exits
+        inputs = input_fingerprints(stage)
+        reason = start_over_reason(stage, inputs)
+        if reason:
+            log(name, f"starting over ({reason}), previous outputs kept in {ASIDE_DIR.relative_to(ROOT)}")
+            move_aside(stage)
+        log(name, f"running {stage.script}")
+        code = run_stage(stage)
+        if code != 0:
+            # Keep the partial outputs where the script can resume from them,
+            # and stamp them with no outputs so the next build reruns the stage.
+            write_stamp(stage, inputs, {})
+            log(name, f"❌ exited with code {code}")
+            return "failed", time.perf_counter() - t0
+
+        write_stamp(stage, inputs, fingerprints(expand(stage.outputs)))
+        return "ran", time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for name in list(pending):
+                deps = [d for d in stages[name].deps if d in order]
+                if any(results.get(d, ("",))[0] in ("failed", "blocked") for d in deps):
+                    log(name, "blocked by failed dependency")
+                    results[name] = ("blocked", 0.0)
+                    pending.remove(name)
+                elif all(d in results for d in deps):
+                    running[pool.submit(start, name)] = name
+                    pending.remove(name)
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    results[name] = fut.result()
+                except Exception as e:
+                    log(name, f"❌ {type(e).__name__}: {e}")
+                    results[name] = ("failed", 0.0)
+
+    return results
+
+
+def print_summary(order: list[str], results: dict, wall: float) -> None:
+    width = max(len(n) for n in order)
+    print("\nStage timings")
+    print("-" * (width + 24))
+    for name in order:
+        status, secs = results.get(name, ("-", 0.0))
+        print(f"{name:<{width}}  {status:<10}  {secs:8.2f}s")
+    print("-" * (width + 24))
+    print(f"{'total':<{width}}  {'':<10}  {wall:8.2f}s (wall)")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Rebuild WA_Vini site data.")
+    p.add_argument("stages", nargs="*", help="Stages to build (default: all). Dependencies are included.")
+    p.add_argument(
+        "--force",
+        action="store_true",
+        help="Rerun the named stages (all if none named) even if up to date; "
+             "their dependencies are still only rebuilt when stale",
+    )
+    p.add_argument("--dry_run", action="store_true", help="Report what would run without running it")
+    p.add_argument("--jobs", type=int, default=2, help="Max stages to run at once (default: 2)")
+    p.add_argument(
+        "--prism_root",
+        default=os.environ.get("PRISM_ROOT"),
+        help="PRISM monthly data folder with tmean/ and ppt/ (default: $PRISM_ROOT)",
+    )
+    args = p.parse_args()
+
+    stages = build_stages(args.prism_root)
+    order = select(stages, args.stages)
+
+    t0 = time.perf_counter()
+    forced = set(args.stages or stages) if args.force else set()
+    results = execute(stages, order, forced, args.dry_run, max(1, args.jobs))
+    print_summary(order, results, time.perf_counter() - t0)
+
+    if any(status in ("failed", "blocked") for status, _ in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
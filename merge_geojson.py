@@ -9,6 +9,10 @@ features = []
 used_ids = set()
 
 for path in sorted(glob.glob(INPUT_GLOB)):
+    # skip our own output so re-runs don't merge it back in
+    if os.path.normpath(path) == os.path.normpath(OUTPUT_FILE):
+        continue
+
     with open(path, "r", encoding="utf-8") as f:
         gj = json.load(f)
 